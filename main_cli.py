@@ -1,3 +1,7 @@
+import queue
+import subprocess
+import threading
+
 import matplotlib.animation as animation
 import matplotlib.pyplot as plt
 import numpy as np
@@ -6,6 +10,46 @@ import numpy as np
 # Repo: https://github.com/overstimulation/sierpinski-carpet-animation
 
 
+# Compiled carpet kernel, built on the first create_sierpinski_carpet call (False if Numba isn't installed)
+_carpet_nb = None
+
+
+def _get_carpet_kernel():
+    """
+    Return the Numba carpet kernel, compiling it on first use, or None if Numba isn't installed.
+    """
+    global _carpet_nb
+    if _carpet_nb is None:
+        try:
+            from numba import njit, prange
+        except ImportError:  # Numba is optional, fall back to the NumPy implementation
+            _carpet_nb = False
+            return None
+
+        @njit(parallel=True, cache=True)
+        def carpet_kernel(order, size, out):
+            # Bit k of middle[c] is set if the k-th base-3 digit of coordinate c is 1
+            middle = np.zeros(size, dtype=np.uint64)
+            for c in range(size):
+                x = c
+                for k in range(order):
+                    if x == 0:
+                        break
+                    if x % 3 == 1:
+                        middle[c] |= np.uint64(1) << np.uint64(k)
+                    x //= 3
+
+            # Single fused pass over the output, rows are split across cores
+            for i in prange(size):
+                row_middle = middle[i]
+                for j in range(size):
+                    # A hole at any level if both coordinates are in the middle third there
+                    out[i, j] = 0 if row_middle & middle[j] else 1
+
+        _carpet_nb = carpet_kernel
+    return _carpet_nb or None
+
+
 def create_sierpinski_carpet(order, size=243):
     """
     Generate a Sierpiński carpet of the given order.
@@ -17,30 +61,37 @@ def create_sierpinski_carpet(order, size=243):
     Returns:
     - A numpy array representing the carpet (1 = filled, 0 = empty)
     """
-    # Initialise with a filled square
-    carpet = np.ones((size, size), dtype=int)
-
-    # Return early for order 0
-    if order == 0:
+    carpet_kernel = _get_carpet_kernel()
+    if carpet_kernel is not None:
+        carpet = np.empty((size, size), dtype=np.uint8)
+        carpet_kernel(order, size, carpet)
         return carpet
 
-    for i in range(size):
-        for j in range(size):
-            # For each pixel, check if it's in a "hole" at any level
-            x, y = i, j
-            for _ in range(order):
-                # If we're in the middle third of the current square, it's a hole
-                if (x % 3 == 1) and (y % 3 == 1):
-                    carpet[i, j] = 0
-                    break
+    # Levels that can produce a hole, beyond these every coordinate has a base-3 digit of 0
+    levels = 0
+    while levels < order and 3**levels < size:
+        levels += 1
 
-                # Prepare for next iteration by dividing coordinates by 3
-                x //= 3
-                y //= 3
+    # Bit k of middle[c] is set if the k-th base-3 digit of coordinate c is 1
+    coords = np.arange(size)
+    middle = np.zeros(size, dtype=np.min_scalar_type((1 << levels) - 1))
+    for k in range(levels):
+        middle |= ((coords // 3**k % 3 == 1) << k).astype(middle.dtype)
+
+    # A pixel is a hole if both coordinates are in the middle third at the same level
+    carpet = ((middle[:, None] & middle[None, :]) == 0).view(np.uint8)
 
     return carpet
 
 
+def _tile_carpet(carpet, side):
+    """
+    Tile a square carpet to side x side (side must be a multiple of its size).
+    """
+    reps = side // carpet.shape[0]
+    return np.tile(carpet, (reps, reps))
+
+
 def create_sierpinski_animation(
     max_order=6,
     frames_per_order=15,
@@ -58,78 +109,144 @@ def create_sierpinski_animation(
     Creates and saves an animation of the Sierpiński carpet evolution.
     Optionally calls progress_callback(percent:int), preview_callback(np.ndarray), phase_callback(str), and cancel_callback() for GUI updates and cancellation.
     """
-    # Total number of frames
-    total_frames = max_order * frames_per_order + frames_per_order
-
-    # Set up the figure and axes
+    # Set up the figure and a bare axes filling it, so drawing a frame only draws the image
     fig = plt.figure(figsize=(8, 8))
-    ax = plt.axes()
-    ax.set_xticks([], [])
-    ax.set_yticks([], [])
-    fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+
+    # Frames are rendered at roughly the figure's pixel size rather than the full carpet size, by keeping
+    # every step-th pixel. The step is the power of 3 closest to the ratio, so the fractal stays sharp,
+    # but holes finer than the step are dropped
+    target_size = int(fig.get_size_inches()[0] * fig.dpi)
+    step = 1
+    while abs(-(-size // (step * 3)) - target_size) < abs(-(-size // step) - target_size):
+        step *= 3
+    display_size = -(-size // step)
+
+    # Orders up to log3(step) only add holes finer than the step, so they all display as a solid square.
+    # Transitions between them would change no pixels, so the animation starts at the last of them
+    first_order = 0
+    while 3**first_order < step and first_order < max_order:
+        first_order += 1
+
+    # Total number of frames
+    total_frames = (max_order - first_order) * frames_per_order + frames_per_order
 
     # Create an initial empty image plot with a defined color range
-    img = ax.imshow(np.ones((size, size)), cmap=cmap, interpolation="nearest", animated=True, vmin=0, vmax=1)
+    img = ax.imshow(
+        np.ones((display_size, display_size)), cmap=cmap, interpolation="nearest", animated=True, vmin=0, vmax=1
+    )
+    ax.set_autoscale_on(False)
 
     # Print information about carpet generation
     print("Generating Sierpiński carpets...")
     if phase_callback:
         phase_callback("Generating carpets...")
 
-    # Precompute all carpet orders
+    # Precompute all carpet orders by tiling instead of recomputing each from scratch.
+    # The smallest holes are cut first, so order k at any size is the 3^k carpet tiled, and
+    # the 3^(k+1) carpet is the 3^k one with every filled pixel replaced by the 3x3 base pattern
+    base = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=np.uint8)
+    side = 1
+    levels = 0
+    while side < size:
+        side *= 3
+        levels += 1
+    carpet_small = np.ones((1, 1), dtype=np.uint8)
+
+    # Orders past the number of levels add no holes at pixel level, so they share the last carpet
+    effective_max_order = min(max_order, levels)
+
+    # Carpets are kept at their natural 3^k size, bit-packed (8 pixels per byte)
     carpets = []
-    for order in range(max_order + 1):
+
+    def display_carpet(order):
+        # Tile the stored carpet out to the display size, sampling every step-th pixel of the full size
+        packed = carpets[order]
+        carpet = np.unpackbits(packed, axis=1, count=packed.shape[0])
+        return _tile_carpet(carpet[::step, ::step], side // step)[:display_size, :display_size]
+
+    for order in range(effective_max_order + 1):
         if cancel_callback and cancel_callback():
             plt.close(fig)
             if phase_callback:
                 phase_callback("Cancelled")
             return
         print(f"  Generating order {order}...")
-        carpet = create_sierpinski_carpet(order, size)
-        carpets.append(carpet)
+        carpets.append(np.packbits(carpet_small, axis=1))
         # Progress for carpet generation (0-30%)
         if progress_callback:
-            progress_callback(int(30 * (order + 1) / (max_order + 1)))
+            progress_callback(int(30 * (order + 1) / (effective_max_order + 1)))
         if preview_callback:
-            preview_callback(carpet)
+            preview_callback(display_carpet(order))
+        if order < effective_max_order:
+            carpet_small = np.kron(carpet_small, base)
+    carpets.extend([carpets[effective_max_order]] * (max_order - effective_max_order))
 
     if phase_callback:
         phase_callback("Creating animation frames...")
 
+    # Precompute every frame up front so animate only has to look it up. Each transition is built
+    # as one (frames_per_order, display_size, display_size) batch: a pixel switches to the next order once the
+    # blend level passes its random dissolve threshold, drawn once per transition
+    rng = np.random.default_rng()
+    blend_levels = (np.arange(frames_per_order) * 256 // frames_per_order).astype(np.uint8)
+    # Working buffers reused across transitions
+    switched = np.empty((frames_per_order, display_size, display_size), dtype=bool)
+    final_frame = np.packbits(display_carpet(max_order), axis=1)
+    frames = []
+    for order in range(first_order, max_order):
+        if cancel_callback and cancel_callback():
+            plt.close(fig)
+            if phase_callback:
+                phase_callback("Cancelled")
+            return
+        if carpets[order] is carpets[order + 1]:
+            # Nothing changes past the effective maximum order, hold the final carpet instead of blending
+            frames.extend([final_frame] * frames_per_order)
+            if progress_callback:
+                progress_callback(30 + int(30 * (order - first_order + 1) / (max_order - first_order + 1)))
+            continue
+        current_carpet = display_carpet(order)
+        next_carpet = display_carpet(order + 1)
+        dissolve_thresholds = rng.integers(0, 256, size=(display_size, display_size), dtype=np.uint8)
+        # Blend on the packed carpets as (current & ~switched) | (next & switched), 8 pixels per byte.
+        # Unchanged pixels are equal in both carpets, so they need no separate change mask
+        np.less(dissolve_thresholds[None], blend_levels[:, None, None], out=switched)
+        switched_packed = np.packbits(switched, axis=2)
+        kept_packed = np.invert(switched_packed)
+        np.bitwise_and(kept_packed, np.packbits(current_carpet, axis=1), out=kept_packed)
+        np.bitwise_and(switched_packed, np.packbits(next_carpet, axis=1), out=switched_packed)
+        frames.extend(np.bitwise_or(kept_packed, switched_packed, out=kept_packed))
+        # Progress for frame creation (30-60%)
+        if progress_callback:
+            progress_callback(30 + int(30 * (order - first_order + 1) / (max_order - first_order + 1)))
+
+    # Hold the final carpet for the last frames_per_order frames
+    frames.extend([final_frame] * frames_per_order)
+
+    # Held frames share one packed array, so unpack only when the packed frame changes
+    last_packed_frame = None
+    last_carpet_frame = None
+
+    def get_frame(frame):
+        nonlocal last_packed_frame, last_carpet_frame
+        if frames[frame] is not last_packed_frame:
+            last_packed_frame = frames[frame]
+            last_carpet_frame = np.unpackbits(last_packed_frame, axis=1, count=display_size)
+        return last_carpet_frame
+
     def animate(frame):
         if cancel_callback and cancel_callback():
             raise RuntimeError("Cancelled")
-        # Calculate order and transition progress
-        current_order = min(frame // frames_per_order, max_order)
-        next_order = min(current_order + 1, max_order)
-        blend_factor = (frame % frames_per_order) / frames_per_order
-
-        if current_order == max_order:
-            # If we've reached the max order, just show the final carpet
-            carpet_frame = carpets[current_order]
-        else:
-            # Create a smooth transition between orders
-            current_carpet = carpets[current_order]
-            next_carpet = carpets[next_order]
-
-            # Only apply transition to areas that will change
-            carpet_frame = current_carpet.copy()
-
-            # Identify changing pixels
-            changing_pixels = current_carpet != next_carpet
-
-            # Apply random dissolve effect for transition
-            if blend_factor > 0:
-                random_mask = np.random.random(size=(size, size)) < blend_factor
-                pixels_to_change = changing_pixels & random_mask
-                carpet_frame[pixels_to_change] = next_carpet[pixels_to_change]
+        carpet_frame = get_frame(frame)
 
         # Update the image data
         img.set_data(carpet_frame)
 
-        # Progress for animation creation (30-90%)
+        # Progress for saving the animation (60-90%)
         if progress_callback:
-            progress_callback(30 + int(60 * frame / total_frames))
+            progress_callback(60 + int(30 * frame / total_frames))
         if preview_callback:
             preview_callback(carpet_frame)
 
@@ -139,27 +256,120 @@ def create_sierpinski_animation(
     print(f"Creating animation ({total_frames} frames)... This may take a while.")
     if phase_callback:
         phase_callback("Saving animation...")
-    try:
-        anim = animation.FuncAnimation(fig, animate, frames=total_frames, interval=1000 / fps, blit=True)
-    except RuntimeError as e:
-        if str(e) == "Cancelled":
-            plt.close(fig)
-            if phase_callback:
-                phase_callback("Cancelled")
-            return
-        else:
-            raise
 
     # Save the animation
     save_error = None
     if as_mp4:
         try:
             filename = f"{output_filename}.mp4"
-            Writer = animation.writers["ffmpeg"]
-            writer = Writer(fps=fps, bitrate=1800)
-            anim.save(filename, writer=writer)
+            # Pipe raw RGB frames straight into ffmpeg instead of drawing each one through matplotlib
+            colours = (plt.get_cmap(cmap)([0.0, 1.0])[:, :3] * 255).round().astype(np.uint8)
+            filled_colour = "0x{:02x}{:02x}{:02x}".format(*colours[1])
+            ffmpeg = subprocess.Popen(
+                [
+                    "ffmpeg",
+                    "-y",
+                    "-loglevel",
+                    "error",
+                    "-f",
+                    "rawvideo",
+                    "-pix_fmt",
+                    "rgb24",
+                    "-s",
+                    f"{display_size}x{display_size}",
+                    "-r",
+                    str(fps),
+                    "-i",
+                    "-",
+                    # Scale up to the figure's pixel size like the GIF output, keeping pixels sharp, and
+                    # pad to even dimensions for yuv420p with the carpet's own border colour
+                    "-vf",
+                    f"scale={target_size}:{target_size}:flags=neighbor,"
+                    f"pad=ceil(iw/2)*2:ceil(ih/2)*2:color={filled_colour}",
+                    "-c:v",
+                    "libx264",
+                    # Flat black and white content needs no slow analysis, and CRF beats a fixed bitrate here
+                    "-preset",
+                    "ultrafast",
+                    "-tune",
+                    "stillimage",
+                    "-crf",
+                    "28",
+                    "-g",
+                    str(fps * 10),
+                    "-pix_fmt",
+                    "yuv420p",
+                    filename,
+                ],
+                stdin=subprocess.PIPE,
+                bufsize=1 << 20,
+            )
+            # Frames are colour-mapped on a producer thread while this one writes to ffmpeg, so building
+            # frame N + 1 overlaps with encoding frame N. Queued frames use a ring of reusable buffers,
+            # large enough that none is refilled while still queued or being written
+            frame_queue = queue.Queue(maxsize=4)
+            stop_producing = threading.Event()
+            rgb_frames = [np.empty((display_size, display_size, 3), dtype=np.uint8) for _ in range(6)]
+
+            def put_frame(item):
+                # Give up once the writer has stopped, so the producer never blocks on a full queue
+                while not stop_producing.is_set():
+                    try:
+                        frame_queue.put(item, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        pass
+                return False
+
+            def produce_frames():
+                try:
+                    filled = 0
+                    for frame in range(total_frames):
+                        # Repeats of a held frame are queued again without rebuilding them
+                        if filled == 0 or frames[frame] is not frames[frame - 1]:
+                            carpet_frame = np.unpackbits(frames[frame], axis=1, count=display_size)
+                            rgb_frame = rgb_frames[filled % len(rgb_frames)]
+                            np.take(colours, carpet_frame, axis=0, out=rgb_frame)
+                            filled += 1
+                        if not put_frame((carpet_frame, rgb_frame)):
+                            return
+                except Exception as e:
+                    put_frame(e)
+
+            producer = threading.Thread(target=produce_frames, daemon=True)
+            producer.start()
+            try:
+                for frame in range(total_frames):
+                    if cancel_callback and cancel_callback():
+                        raise RuntimeError("Cancelled")
+                    item = frame_queue.get()
+                    if isinstance(item, Exception):
+                        raise item
+                    carpet_frame, rgb_frame = item
+                    ffmpeg.stdin.write(rgb_frame.data)
+
+                    # Progress for saving the animation (60-90%)
+                    if progress_callback:
+                        progress_callback(60 + int(30 * frame / total_frames))
+                    if preview_callback:
+                        preview_callback(carpet_frame)
+                ffmpeg.stdin.close()
+            except BaseException:
+                ffmpeg.kill()
+                raise
+            finally:
+                stop_producing.set()
+                producer.join()
+                ffmpeg.wait()
+            if ffmpeg.returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with code {ffmpeg.returncode}")
             print(f"Animation saved as {filename}")
         except Exception as e:
+            if str(e) == "Cancelled":
+                plt.close(fig)
+                if phase_callback:
+                    phase_callback("Cancelled")
+                return
             print(f"\nError saving as MP4: {e}")
             print("Ensure ffmpeg is installed and accessible in your system's PATH.")
             print("Falling back to GIF (requires Pillow).")
@@ -169,6 +379,7 @@ def create_sierpinski_animation(
     if not as_mp4:
         try:
             filename = f"{output_filename}.gif"
+            anim = animation.FuncAnimation(fig, animate, frames=total_frames, interval=1000 / fps, blit=True)
             anim.save(filename, writer="pillow", fps=fps)
             print(f"Animation saved as {filename}")
         except Exception as e:
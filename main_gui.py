@@ -2,8 +2,9 @@ import os
 import sys
 import warnings
 
+import numpy as np
 from PySide6.QtCore import Qt, QThread, QUrl, Signal
-from PySide6.QtGui import QDesktopServices, QImage, QPixmap, QValidator
+from PySide6.QtGui import QDesktopServices, QImage, QPixmap, QValidator, qRgb
 from PySide6.QtWidgets import (
     QApplication,
     QComboBox,
@@ -28,29 +29,27 @@ warnings.filterwarnings("ignore")  # Suppress all warnings
 
 
 class PowerOfThreeSpinBox(QSpinBox):
+    ALLOWED_SIZES = tuple(3**n for n in range(1, 11))  # 3, 9, ..., 3^10
+    SIZE_INDEX = {size: idx for idx, size in enumerate(ALLOWED_SIZES)}
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.allowed_sizes = [3**n for n in range(1, 11)]  # 3, 9, ..., 3^10
-        self.setRange(self.allowed_sizes[0], self.allowed_sizes[-1])
-        self.setValue(self.allowed_sizes[6])  # Default to 2187 (3^7)
+        self.setRange(self.ALLOWED_SIZES[0], self.ALLOWED_SIZES[-1])
+        self.setValue(self.ALLOWED_SIZES[6])  # Default to 2187 (3^7)
         self.setKeyboardTracking(False)
 
     def keyPressEvent(self, event):
         event.ignore()  # Ignore all key presses to block keyboard input
 
     def stepBy(self, steps):
-        current = self.value()
-        try:
-            idx = self.allowed_sizes.index(current)
-        except ValueError:
-            idx = 0
-        idx = max(0, min(idx + steps, len(self.allowed_sizes) - 1))
-        self.setValue(self.allowed_sizes[idx])
+        idx = self.SIZE_INDEX.get(self.value(), 0)
+        idx = max(0, min(idx + steps, len(self.ALLOWED_SIZES) - 1))
+        self.setValue(self.ALLOWED_SIZES[idx])
 
     def validate(self, text, pos):
         try:
             val = int(text)
-            if val in self.allowed_sizes:
+            if val in self.SIZE_INDEX:
                 return (QValidator.State.Acceptable, text, pos)
             else:
                 return (QValidator.State.Intermediate, text, pos)
@@ -60,7 +59,7 @@ class PowerOfThreeSpinBox(QSpinBox):
     def valueFromText(self, text):
         try:
             val = int(text)
-            if val in self.allowed_sizes:
+            if val in self.SIZE_INDEX:
                 return val
             else:
                 return self.value()
@@ -178,9 +177,10 @@ class SierpinskiGUI(QWidget):
             self.preview_label.setText("Live preview will appear here")
             return
         h, w = np_array.shape
-        # Convert 1/0 to 255/0 grayscale
-        img = (np_array * 255).astype("uint8")
-        qimg = QImage(img.data, w, h, w, QImage.Format.Format_Grayscale8)
+        # Pack 8 pixels per byte into a 1-bit image, with 1 drawn white and 0 black
+        packed = np.packbits(np_array.astype(np.uint8, copy=False), axis=1, bitorder="big")
+        qimg = QImage(packed.data, w, h, packed.strides[0], QImage.Format.Format_Mono)
+        qimg.setColorTable([qRgb(0, 0, 0), qRgb(255, 255, 255)])
         pixmap = QPixmap.fromImage(qimg).scaled(220, 220, Qt.AspectRatioMode.KeepAspectRatio)
         self.preview_label.setPixmap(pixmap)
 
@@ -281,18 +281,30 @@ class AnimationWorker(QThread):
         self._cancelled = False
         self._start_time = None
         self._last_progress = 0
+        self._last_preview_time = 0.0
+        self._pending_preview = None
 
     def run(self):
         import time
 
         self._start_time = time.time()
         self._last_progress = 0
+        self._last_preview_time = 0.0
+        self._pending_preview = None
 
         def progress_callback(val):
             self._last_progress = val
             self.progress_signal.emit(val)
 
         def preview_callback(np_array):
+            # Throttle previews, the label can't show every frame and each emit queues a full array
+            # Keep the latest dropped frame so it can still be shown once the run ends
+            now = time.monotonic()
+            if now - self._last_preview_time < 0.1:
+                self._pending_preview = np_array
+                return
+            self._last_preview_time = now
+            self._pending_preview = None
             self.preview_signal.emit(np_array)
 
         def phase_callback(text):
@@ -312,6 +324,9 @@ class AnimationWorker(QThread):
                 phase_callback=phase_callback,
                 cancel_callback=self.is_cancelled,
             )
+            if self._pending_preview is not None:
+                self.preview_signal.emit(self._pending_preview)
+                self._pending_preview = None
             if self._cancelled:
                 self.phase_signal.emit("Cancelled")
                 self.cancelled_signal.emit()